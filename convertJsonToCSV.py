@@ -4,64 +4,268 @@ import csv
 import gzip
 import io
 import json
+import mmap
+import multiprocessing
 import os
+import pickle
 import sys
+import tempfile
+from contextlib import closing
+from functools import lru_cache
 from itertools import product
+from operator import itemgetter
 
-# flatten a nested dict into one level using dotted keys
-def flatten_dict(obj, parent_key='', sep='.', keep_lists_for=None, explode_all=False):
-    # if the root is not a dict, make it a simple dict
+# prefer orjson (c parser, takes bytes directly) and fall back to stdlib json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# translate table that turns digits into b'0', keeps minus signs and blanks the rest, to find digit runs in c
+DIGIT_RUN_TABLE = bytes(0x30 if 0x30 <= b <= 0x39 else b if b == 0x2d else 0x20 for b in range(256))
+
+# digit runs that may be integers outside orjson's range (int64 down to -9223372036854775808, uint64 up to
+# 18446744073709551615), which it silently reads as floats
+WIDE_INT_RUN = b'0' * 20
+WIDE_NEG_INT_RUN = b'-' + b'0' * 19
+
+# parse one ndjson line (bytes) into python objects
+if orjson is not None:
+    def parse_json(line):
+        # json keeps wide integers exact, only lines with a long digit run pay for it
+        runs = line.translate(DIGIT_RUN_TABLE)
+        if WIDE_INT_RUN in runs or WIDE_NEG_INT_RUN in runs:
+            return json.loads(line)
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            # orjson rejects some input json accepts (NaN, Infinity, 1e400), let json decide
+            return json.loads(line)
+else:
+    parse_json = json.loads
+
+# pyarrow is optional, used by --engine arrow
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.csv
+    import pyarrow.json
+except ImportError:
+    pyarrow = None
+
+# python-isal is optional, it compresses .gz output on several threads
+try:
+    from isal import igzip_threaded
+except ImportError:
+    igzip_threaded = None
+
+# rapidgzip is optional, it decompresses .gz input in parallel
+try:
+    import rapidgzip
+except ImportError:
+    rapidgzip = None
+
+# rapidgzip seek point indexes from a full read, so pass 2 can reuse them
+GZIP_INDEX_CACHE = {}
+
+# size of the reused block buffer for gzip reads
+GZIP_BLOCK_SIZE = 1 << 20
+
+# list element types whose json text can be cached by value (bool/float excluded, True == 1 == 1.0)
+STR_LIST_TYPES = frozenset((str,))
+INT_LIST_TYPES = frozenset((int,))
+
+# longest list whose json text is cached
+CACHEABLE_LIST_LEN = 32
+
+# most characters in the strings of a cached list, so unique long lists do not pile up in the cache
+CACHEABLE_LIST_CHARS = 256
+
+# largest byte range handed to one worker in --workers mode
+PARALLEL_CHUNK_SIZE = 16 << 20
+
+# bytes of ndjson parsed into one arrow record batch in --engine arrow
+ARROW_BLOCK_SIZE = 16 << 20
+
+# floats this large that are whole numbers came from integers arrow could not hold in int64
+ARROW_WIDE_INT = float(1 << 63)
+
+# deepest dotted column the generated row builder handles (python caps indentation at 100 levels)
+ROW_BUILDER_MAX_DEPTH = 30
+
+# number of csv rows handed to writer.writerows at once
+WRITE_BATCH_SIZE = 1024
+
+# pass 1 stops after this many lines in a row without a new column (unless --strict-discovery)
+DISCOVERY_STABLE_LINES = 50000
+
+# column holding, as a json object, the cells of columns first seen after discovery stopped early
+# (prefixed with more underscores when the input has a column of that name)
+EXTRA_COLUMN = '_extra'
+
+# simdjson is optional, used for lazy key discovery in pass 1
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+# json text for a tuple of strings/ints, the same tag lists tend to repeat across records
+@lru_cache(maxsize=4096)
+def dumps_cached(key):
+    return json.dumps(key, ensure_ascii=False)
+
+# serialize a list or dict to json text, short lists of strings or of ints come from the cache
+def dumps_json(val):
+    if type(val) is list and len(val) <= CACHEABLE_LIST_LEN:
+        types = set(map(type, val))
+        if types <= INT_LIST_TYPES or types == STR_LIST_TYPES and sum(map(len, val)) <= CACHEABLE_LIST_CHARS:
+            return dumps_cached(tuple(val))
+    return json.dumps(val, ensure_ascii=False)
+
+# flatten a nested dict into out (e.g. a prefilled row) using dotted keys
+def flatten_into(obj, out, parent_key='', sep='.', keep_lists_for=None, explode_all=False):
+    # if the root is not a dict, store it as a single value
     if not isinstance(obj, dict):
-        return {parent_key or 'value': obj}
-    # hold flattened items
-    items = []
+        out[parent_key or 'value'] = obj
+        return out
     # define which keys should stay as lists
-    keep_lists_for = set(keep_lists_for or [])
-    # walk through each key/value
-    for k, v in obj.items():
-        # build the dotted key
-        new_key = f'{parent_key}{sep}{k}' if parent_key else k
-        # if value is dict, flatten it
-        if isinstance(v, dict):
-            items.extend(flatten_dict(v, new_key, sep=sep, keep_lists_for=keep_lists_for, explode_all=explode_all).items())
-        # if value is list
-        elif isinstance(v, list):
-            # if explode_all, keep lists as lists
-            if explode_all:
-                items.append((new_key, v))
-            # if single-column explode requested for this exact key, keep as list
-            elif new_key in keep_lists_for:
-                items.append((new_key, v))
-            # otherwise keep as json string so csv stays rectangular
+    if not isinstance(keep_lists_for, (set, frozenset)):
+        keep_lists_for = set(keep_lists_for or [])
+    # walk nested dicts with a stack of (items iterator, key prefix) instead of recursion
+    stack = [(iter(obj.items()), parent_key + sep if parent_key else '')]
+    while stack:
+        items, prefix = stack[-1]
+        # walk through each key/value of the dict on top of the stack
+        for k, v in items:
+            # build the dotted key
+            new_key = prefix + k
+            # if value is dict, flatten it first and come back to this dict after
+            if isinstance(v, dict):
+                stack.append((iter(v.items()), new_key + sep if new_key else ''))
+                break
+            # if value is list
+            elif isinstance(v, list):
+                # if explode_all, keep lists as lists
+                if explode_all:
+                    out[new_key] = v
+                # if single-column explode requested for this exact key, keep as list
+                elif new_key in keep_lists_for:
+                    out[new_key] = v
+                # otherwise keep as json string so csv stays rectangular
+                else:
+                    out[new_key] = dumps_json(v)
+            # otherwise keep the value
             else:
-                items.append((new_key, json.dumps(v, ensure_ascii=False)))
-        # otherwise keep the value
+                out[new_key] = v
+        # this dict is done
         else:
-            items.append((new_key, v))
-    # return flattened dict
-    return dict(items)
+            stack.pop()
+    # return the filled dict
+    return out
+
+# flatten a nested dict into one level using dotted keys
+def flatten_dict(obj, parent_key='', sep='.', keep_lists_for=None, explode_all=False):
+    return flatten_into(obj, {}, parent_key, sep=sep, keep_lists_for=keep_lists_for, explode_all=explode_all)
 
-# open a text file for reading, works with .gz or plain
-def open_text_read(path):
-    # if ends with .gz use gzip text mode
+# open a file for binary reading, works with .gz or plain
+def open_binary_read(path):
+    # if ends with .gz use gzip binary mode
     if path.lower().endswith('.gz'):
-        return gzip.open(path, 'rt', encoding='utf-8', newline='')
-    # otherwise open regular text
-    return open(path, 'r', encoding='utf-8', newline='')
+        # parallel decoder, reusing the index from an earlier full read if we have one
+        if rapidgzip is not None:
+            gz = rapidgzip.open(path, parallelization=os.cpu_count() or 0)
+            index = GZIP_INDEX_CACHE.get(os.path.abspath(path))
+            if index is not None:
+                gz.import_index(io.BytesIO(index))
+            return gz
+        # gzip.open as-is: a 128 KiB io.BufferedReader on top gains nothing once gzip is read in 1 MiB blocks
+        return gzip.open(path, 'rb')
+    # otherwise open regular binary, the parser decodes utf-8 itself
+    return open(path, 'rb')
 
 # open a text file for writing, can gzip if path ends with .gz
 def open_text_write(path):
     # if ends with .gz, open gzip in binary then wrap to text
     if path.lower().endswith('.gz'):
-        gz = gzip.open(path, 'wb')
+        # isal deflates blocks on background threads, stdlib gzip is single-threaded
+        if igzip_threaded is not None:
+            gz = igzip_threaded.open(path, 'wb', threads=os.cpu_count() or 1)
+        else:
+            gz = gzip.open(path, 'wb')
+        # (writing pre-encoded batches to gz directly measured no faster, csv formatting dominates)
         return io.TextIOWrapper(gz, encoding='utf-8', newline='')
     # otherwise open regular text
     return open(path, 'w', encoding='utf-8', newline='')
 
+# yield non-empty lines from a mapped file (or a byte range of it) by finding newlines in place
+def iter_mmap_lines(buf, start=0, end=None):
+    # bind find once, it is called for every line
+    find = buf.find
+    end = len(buf) if end is None else end
+    pos = start
+    while pos < end:
+        # find the end of this line (or the end of the file)
+        nl = find(b'\n', pos, end)
+        if nl < 0:
+            nl = end
+        # slice the line out as bytes, parsers accept surrounding whitespace
+        line = buf[pos:nl]
+        pos = nl + 1
+        # skip empty and whitespace-only lines
+        if line and not line.isspace():
+            yield line
+
+# yield non-empty lines from a binary stream, reading blocks into one reused buffer
+# (this saves readline's per-line reads; the gzip decompressor still allocates its own output)
+def iter_block_lines(f, block_size=GZIP_BLOCK_SIZE):
+    # readinto fills the whole block unless the stream ends
+    readinto = f.readinto
+    # one buffer for every block, and a carry for the partial line at its end
+    buf = bytearray(block_size)
+    view = memoryview(buf)
+    tail = b''
+    while True:
+        n = readinto(buf)
+        if not n:
+            break
+        # only split up to the last newline in this block
+        last = buf.rfind(b'\n', 0, n)
+        if last < 0:
+            tail += view[:n]
+            continue
+        # split all full lines of the block in one call, prefixed by the carry
+        for line in (tail + view[:last]).split(b'\n'):
+            # skip empty and whitespace-only lines
+            if line and not line.isspace():
+                yield line
+        # keep the partial line for the next block
+        tail = bytes(view[last + 1:n])
+    # last line without a trailing newline
+    if tail and not tail.isspace():
+        yield tail
+
 # yield non-empty lines from an ndjson file
 def iter_ndjson_lines(path):
-    # open the file for text reading
-    with open_text_read(path) as f:
+    # open the file for binary reading
+    with open_binary_read(path) as f:
+        # gzip streams are read in blocks into a reused buffer
+        if path.lower().endswith('.gz'):
+            yield from iter_block_lines(f)
+            # keep the seek point index built while reading so the next pass skips that work
+            if rapidgzip is not None and os.path.abspath(path) not in GZIP_INDEX_CACHE:
+                index = io.BytesIO()
+                f.export_index(index)
+                GZIP_INDEX_CACHE[os.path.abspath(path)] = index.getvalue()
+            return
+        # map plain files into memory, unmappable files (empty, pipes) are read line by line
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            buf = None
+        if buf is not None:
+            with buf:
+                yield from iter_mmap_lines(buf)
+            return
         # read line by line
         for line in f:
             # strip whitespace
@@ -69,7 +273,7 @@ def iter_ndjson_lines(path):
             # skip empty lines
             if not s:
                 continue
-            # yield the clean line
+            # yield the clean line as bytes
             yield s
 
 # normalize a value for csv cell
@@ -79,10 +283,133 @@ def to_csv_cell(val):
         return ''
     # if list or dict, serialize
     if isinstance(val, (list, dict)):
-        return json.dumps(val, ensure_ascii=False)
+        return dumps_json(val)
     # otherwise return as-is
     return val
 
+# build a function that pulls the given columns out of a dict as one tuple
+def make_row_getter(columns):
+    # itemgetter returns a bare value (not a tuple) for one key, and needs at least one
+    if len(columns) == 1:
+        col = columns[0]
+        return lambda d: (d[col],)
+    if not columns:
+        return lambda d: ()
+    return itemgetter(*columns)
+
+# emit source lines that set cells c<i> for one dict level of the column tree (flatten mode)
+def emit_row_level(node, var, lines, indent, consts, closed=False):
+    pad = '    ' * indent
+    # keys this level has never shown in pass 1 (e.g. a literal dotted key) go to the generic path
+    consts.append(frozenset(node['children']))
+    lines.append(f'{pad}if not {var}.keys() <= _k{len(consts) - 1}: return None')
+    for name, child in node['children'].items():
+        v = f'v{len(lines)}'
+        lines.append(f'{pad}{v} = {var}.get({name!r}, _MISSING)')
+        # branch: descend into dicts, anything else leaves the nested columns empty
+        if child['children']:
+            lines.append(f'{pad}if type({v}) is dict:')
+            if child['index'] is not None:
+                lines.append(f'{pad}    c{child["index"]} = \'\'')
+            emit_row_level(child, v, lines, indent + 1, consts, closed)
+            lines.append(f'{pad}else:')
+            for i in iter_tree_cells(child, leaf=False):
+                lines.append(f'{pad}    c{i} = \'\'')
+            if child['index'] is not None:
+                emit_row_leaf(child['index'], v, lines, indent + 1, closed)
+            # a value here would be a column the header does not have
+            elif closed:
+                lines.append(f'{pad}    if {v} is not _MISSING: return None')
+        else:
+            emit_row_leaf(child['index'], v, lines, indent, closed)
+
+# emit source lines that turn one leaf value into cell c<i> the way flatten_into + process_record would
+def emit_row_leaf(i, v, lines, indent, closed=False):
+    pad = '    ' * indent
+    lines.append(f'{pad}c{i} = {v}')
+    # a non-empty dict here would flatten into columns the header does not have
+    if closed:
+        lines.append(f'{pad}if type({v}) is dict and {v}: return None')
+    lines.append(f'{pad}if {v} is _MISSING or type({v}) is dict: c{i} = \'\'')
+    lines.append(f'{pad}elif type({v}) is list: c{i} = _dumps({v})')
+
+# yield the column indexes under a column tree node
+def iter_tree_cells(node, leaf=True):
+    if leaf and node['index'] is not None:
+        yield node['index']
+    for child in node['children'].values():
+        yield from iter_tree_cells(child)
+
+# generate a row builder specialized to the discovered columns: build_row(rec) -> tuple, or None
+# when the record has a shape the straight-line code does not cover (then use the generic path),
+# closed: the last column is the extra column, left empty, and records with values outside
+# the other columns (even one named like the extra column) go to the generic path as well
+def compile_row_builder(columns, flatten, sep='.', closed=False):
+    lines = ['def build_row(r):']
+    consts = []
+    # generate lookups for the header columns only, the extra cell is added at the end
+    extra_cells = ''
+    if closed:
+        columns = columns[:-1]
+        extra_cells = "'', "
+    if flatten:
+        # dotted columns become a tree of nested dict lookups
+        root = {'index': None, 'children': {}}
+        for i, col in enumerate(columns):
+            parts = col.split(sep)
+            # empty segments do not map back to nested keys, and very deep trees do not compile
+            if '' in parts or len(parts) > ROW_BUILDER_MAX_DEPTH:
+                return None
+            node = root
+            for part in parts:
+                node = node['children'].setdefault(part, {'index': None, 'children': {}})
+            node['index'] = i
+        emit_row_level(root, 'r', lines, 1, consts, closed)
+    else:
+        if closed:
+            consts.append(frozenset(columns))
+            lines.append('    if not r.keys() <= _k0: return None')
+        # top-level keys only, lists and dicts serialized like to_csv_cell
+        for i, col in enumerate(columns):
+            lines.append(f'    c{i} = r.get({col!r}, \'\')')
+            lines.append(f'    if type(c{i}) is list or type(c{i}) is dict: c{i} = _dumps(c{i})')
+    cells = ''.join(f'c{i}, ' for i in range(len(columns))) + extra_cells
+    lines.append(f'    return ({cells})')
+    # compile the source with its constants
+    namespace = {'_MISSING': object(), '_dumps': dumps_json}
+    namespace.update((f'_k{n}', keys) for n, keys in enumerate(consts))
+    exec(compile('\n'.join(lines), '<build_row>', 'exec'), namespace)
+    return namespace['build_row']
+
+# turn one expanded row dict (already holding every column) into a csv row tuple
+def process_record(row, get_row, convert_cells):
+    # serialize nested values in place (None is written as empty by csv already)
+    if convert_cells:
+        for k, v in row.items():
+            if type(v) in (list, dict):
+                row[k] = to_csv_cell(v)
+    return get_row(row)
+
+# put the cells of columns missing from the header (known) into the extra column as one json object
+# (on a copy: expand_record reuses the row and process_record serializes its cells in place)
+def with_extra_cell(row, known, extra_column):
+    # the row holds the header columns and the empty extra cell, anything else came from the record
+    if len(row) == len(known) + 1 and row[extra_column] == '':
+        return row
+    row = dict(row)
+    extra = {k: v for k, v in row.items() if k not in known}
+    # an input column named like the extra column is kept in the json too
+    if extra[extra_column] == '':
+        del extra[extra_column]
+    row[extra_column] = json.dumps(extra, ensure_ascii=False)
+    return row
+
+# use the compiled hot path when it has been built (python setup.py build_ext --inplace)
+try:
+    from convert_core import flatten_dict, flatten_into, process_record
+except ImportError:
+    pass
+
 # expand one flattened record by exploding lists
 def expand_record(rec, explode_keys):
     # if no explode keys, just yield single row
@@ -99,13 +426,6 @@ def expand_record(rec, explode_keys):
         # if missing -> treat as one empty value
         if val is None:
             value_lists.append([''])
-        # if a string that looks like json array -> try to parse
-        elif isinstance(val, str) and val.startswith('[') and val.endswith(']'):
-            try:
-                parsed = json.loads(val)
-                value_lists.append(parsed if isinstance(parsed, list) else [parsed])
-            except Exception:
-                value_lists.append([val])
         # if already a list -> use it
         elif isinstance(val, list):
             # handle empty list by emitting one empty row to avoid dropping the record
@@ -114,97 +434,501 @@ def expand_record(rec, explode_keys):
         else:
             value_lists.append([val])
         keys_order.append(k)
-    # produce cartesian product
+    # produce cartesian product, reusing one row dict where only the exploded keys change
+    # (consumers must copy a yielded row to keep it, the writer turns it into a tuple right away)
+    row = dict(base)
     for combo in product(*value_lists):
-        row = dict(base)
         for k, v in zip(keys_order, combo):
             row[k] = v
         yield row
 
+# add column names from a lazy simdjson object without converting its values
+def collect_lazy_keys(obj, keys, flatten, parent_key='', sep='.'):
+    # walk the keys straight off the parsed buffer
+    for k in obj.keys():
+        # build the dotted key the same way flatten_dict does
+        new_key = f'{parent_key}{sep}{k}' if parent_key else k
+        # only look at the value when flattening, and only descend into objects
+        if flatten:
+            v = obj[k]
+            if isinstance(v, simdjson.Object):
+                collect_lazy_keys(v, keys, flatten, new_key, sep=sep)
+                continue
+        keys[new_key] = None
+
+# add the column names of one line using simdjson, returns False if it could not parse
+def add_lazy_keys(parser, line, flatten, keys):
+    # let the regular parser handle (and report) anything simdjson rejects
+    try:
+        doc = parser.parse(line)
+    except (ValueError, RuntimeError):
+        return False
+    # non-dict records become a single value column
+    if isinstance(doc, simdjson.Object):
+        collect_lazy_keys(doc, keys, flatten)
+    else:
+        keys['value'] = None
+    # proxies must be gone before the parser is reused, they die with this frame
+    return True
+
+# add the keys of one record to an insertion-ordered dict of column names
+def add_keys(keys, rec):
+    # most records repeat known columns, the superset test is much cheaper than a dict update
+    if not keys.keys() >= rec.keys():
+        keys.update(dict.fromkeys(rec))
+
+# add the column names of one line to keys, lazily when a simdjson parser is given
+def add_line_keys(line, count, keys, lazy_parser, flatten, keep_lists_for, explode_all):
+    # lazy path reads only keys and never materializes values, else parse fully
+    if lazy_parser is not None and add_lazy_keys(lazy_parser, line, flatten, keys):
+        return
+    # parse json for this line
+    try:
+        rec = parse_json(line)
+    except json.JSONDecodeError as e:
+        raise RuntimeError(f'json decode error on line {count}: {e}') from e
+    # force record to dict if not dict
+    if not isinstance(rec, dict):
+        rec = {'value': rec}
+    # flatten if asked
+    if flatten:
+        rec = flatten_dict(rec, keep_lists_for=keep_lists_for, explode_all=explode_all)
+    # add keys in first-seen order
+    add_keys(keys, rec)
+
 # discover all columns by scanning the file once
-def discover_columns(src_path, flatten, explode_key=None, explode_all=False, limit=None, progress_every=200000):
-    # keep a set of column names
-    keys = set()
+# (stable_lines: stop once that many lines in a row added no column, and add an extra column if lines remain)
+# returns (columns, name of the extra column or None)
+def discover_columns(src_path, flatten, explode_key=None, explode_all=False, limit=None, stable_lines=None, sort_columns=False, progress_every=200000):
+    # keep column names in the order they first appear (a dict used as an ordered set)
+    keys = {}
     # count scanned lines
     count = 0
+    # lines since the last new column
+    since_new = 0
+    seen = 0
+    # whether lines were left unscanned because the columns stopped changing
+    stopped_early = False
+    extra_column = None
+    # set list-preserving behavior
+    keep_lists_for = [explode_key] if explode_key else []
+    # reuse one simdjson parser (and its buffer) for every line when available
+    lazy_parser = simdjson.Parser() if simdjson is not None else None
+    # go over each line, closing the reader as soon as we stop (an open rapidgzip reader aborts at exit)
+    with closing(iter_ndjson_lines(src_path)) as lines:
+        for count, line in enumerate(lines, start=1):
+            add_line_keys(line, count, keys, lazy_parser, flatten, keep_lists_for, explode_all)
+            # count lines that brought no new column
+            if len(keys) == seen:
+                since_new += 1
+            else:
+                seen = len(keys)
+                since_new = 0
+            # show progress if needed
+            if progress_every and count % progress_every == 0:
+                print(f'[pass1] scanned {count:,} lines, found {len(keys):,} columns', file=sys.stderr)
+            # stop early if limit set
+            if limit and count >= limit:
+                print(f'[pass1] stopped at discovery limit {limit:,} lines', file=sys.stderr)
+                break
+            # stop early once the columns have settled, later new columns go to the extra column
+            if stable_lines and since_new >= stable_lines:
+                stopped_early = next(lines, None) is not None
+                break
+    # if no lines found, raise
+    if count == 0:
+        raise RuntimeError('no lines found. is this file empty or not ndjson?')
+    # keep input order unless alphabetical columns were asked for
+    cols = sorted(keys) if sort_columns else list(keys)
+    # the extra column goes last, under a name no discovered column has
+    if stopped_early:
+        extra_column = EXTRA_COLUMN
+        while extra_column in keys:
+            extra_column = '_' + extra_column
+        cols.append(extra_column)
+        print(f'[pass1] no new columns in {stable_lines:,} lines, stopped (later ones go to {extra_column})', file=sys.stderr)
+    # print summary
+    print(f'[pass1] done. lines: {count:,}, columns: {len(cols):,}', file=sys.stderr)
+    # return columns list and the extra column
+    return cols, extra_column
+
+# parse each line of an ndjson file into a dict record, flattened if asked
+# (the file is closed when the records are closed, or when parsing fails)
+def iter_records(src_path, flatten, explode_key=None, explode_all=False):
+    with closing(iter_ndjson_lines(src_path)) as lines:
+        yield from parse_records(lines, flatten, explode_key=explode_key, explode_all=explode_all)
+
+# parse each line into a dict record, flattened if asked
+def parse_records(lines, flatten, explode_key=None, explode_all=False):
     # set list-preserving behavior
     keep_lists_for = [explode_key] if explode_key else []
     # go over each line
-    for count, line in enumerate(iter_ndjson_lines(src_path), start=1):
+    for i, line in enumerate(lines, start=1):
         # parse json for this line
         try:
-            rec = json.loads(line)
+            rec = parse_json(line)
         except json.JSONDecodeError as e:
-            raise RuntimeError(f'json decode error on line {count}: {e}') from e
-        # force record to dict if not dict
+            raise RuntimeError(f'json decode error on line {i}: {e}') from e
+        # force dict
         if not isinstance(rec, dict):
             rec = {'value': rec}
         # flatten if asked
         if flatten:
             rec = flatten_dict(rec, keep_lists_for=keep_lists_for, explode_all=explode_all)
-        # add keys to set
-        keys.update(rec.keys())
-        # show progress if needed
-        if progress_every and count % progress_every == 0:
-            print(f'[pass1] scanned {count:,} lines, found {len(keys):,} columns', file=sys.stderr)
-        # stop early if limit set
-        if limit and count >= limit:
-            print(f'[pass1] stopped at discovery limit {limit:,} lines', file=sys.stderr)
-            break
-    # if no lines found, raise
-    if count == 0:
-        raise RuntimeError('no lines found. is this file empty or not ndjson?')
-    # sort columns for stable order
-    cols = sorted(keys)
-    # print summary
-    print(f'[pass1] done. lines: {count:,}, columns: {len(cols):,}', file=sys.stderr)
-    # return columns list
-    return cols
+        yield rec
 
-# write the csv by streaming the file again
-def write_csv(src_path, dst_path, columns, flatten, explode_key=None, explode_all=False, progress_every=200000):
+# turn records into csv row tuples, flattening them unless they come already flattened (single-pass spill)
+# (extra_column: name of the column collecting cells of columns the header lacks, if there is one)
+def iter_rows(records, columns, flatten, explode_key=None, explode_all=False, preflattened=False, extra_column=None, build_row=None):
+    # set list-preserving behavior
+    keep_lists_for = {explode_key} if explode_key else set()
+    # flatten straight into the row instead of building a flattened dict first
+    flatten_rows = flatten and not preflattened
+    # row template with every column defaulting to an empty cell
+    template = dict.fromkeys(columns, '')
+    # pull all columns out in one c-level call
+    get_row = make_row_getter(columns)
+    # flattened records without explode never carry lists or dicts, so skip the cell check
+    convert_cells = not flatten or bool(explode_key) or explode_all
+    # columns of the header, anything else goes to the extra column (the last one) when there is one
+    known = frozenset(columns[:-1]) if extra_column is not None else None
+    # without explode every record is one row, built by straight-line code generated for these columns (unless the caller already has it)
+    if build_row is None and not explode_key and not explode_all:
+        build_row = compile_row_builder(columns, flatten_rows, closed=extra_column is not None)
+    # go over each record
+    for rec in records:
+        # fast path, falls through to the generic one for shapes it does not cover
+        if build_row is not None:
+            row = build_row(rec)
+            if row is not None:
+                yield row
+                continue
+        # fill a fresh copy of the template so missing columns are empty
+        row = template.copy()
+        # explode-all follows the record's own key order (not the header's), so flatten it on its own
+        if explode_all:
+            if flatten_rows:
+                rec = flatten_dict(rec, explode_all=True)
+            explode_keys = [k for k, v in rec.items() if isinstance(v, list)]
+            row.update(rec)
+        # otherwise flatten straight into the row
+        else:
+            if flatten_rows:
+                flatten_into(rec, row, keep_lists_for=keep_lists_for)
+            else:
+                row.update(rec)
+            explode_keys = [explode_key] if explode_key else []
+        # expand into one or more rows
+        for expanded in expand_record(row, explode_keys):
+            if extra_column is not None:
+                expanded = with_extra_cell(expanded, known, extra_column)
+            yield process_record(expanded, get_row, convert_cells)
+
+# write csv rows for records, flattening them unless they come already flattened (single-pass spill)
+def write_records(records, dst_path, columns, flatten, explode_key=None, explode_all=False, progress_every=200000, preflattened=False, extra_column=None):
     # make sure the output folder exists
     os.makedirs(os.path.dirname(os.path.abspath(dst_path)) or '.', exist_ok=True)
-    # set list-preserving behavior
-    keep_lists_for = [explode_key] if explode_key else []
     # open output csv (gz if .gz extension used)
     with open_text_write(dst_path) as out_f:
-        # create csv writer
+        # create csv writer (the c writer beat a hand-rolled join + quote-if-needed writer, so keep it)
         writer = csv.writer(out_f)
         # write header
         writer.writerow(columns)
         # count written rows
         written = 0
-        # read ndjson again
-        for i, line in enumerate(iter_ndjson_lines(src_path), start=1):
-            # parse json for this line
-            try:
-                rec = json.loads(line)
-            except json.JSONDecodeError as e:
-                raise RuntimeError(f'json decode error on line {i}: {e}') from e
-            # force dict
-            if not isinstance(rec, dict):
-                rec = {'value': rec}
-            # flatten if asked
-            if flatten:
-                rec = flatten_dict(rec, keep_lists_for=keep_lists_for, explode_all=explode_all)
-            # decide which keys to explode
-            if explode_all:
-                explode_keys = [k for k, v in rec.items() if isinstance(v, list)]
-            elif explode_key:
-                explode_keys = [explode_key]
-            else:
-                explode_keys = []
-            # expand and write rows
-            for expanded in expand_record(rec, explode_keys):
-                row = [to_csv_cell(expanded.get(col, '')) for col in columns]
-                writer.writerow(row)
-                written += 1
-                if progress_every and written % progress_every == 0:
-                    print(f'[pass2] wrote {written:,} rows', file=sys.stderr)
+        # rows waiting to be written in one writerows call
+        batch = []
+        # expand and write rows
+        for row in iter_rows(records, columns, flatten, explode_key=explode_key, explode_all=explode_all, preflattened=preflattened, extra_column=extra_column):
+            batch.append(row)
+            if len(batch) >= WRITE_BATCH_SIZE:
+                writer.writerows(batch)
+                batch.clear()
+            written += 1
+            if progress_every and written % progress_every == 0:
+                print(f'[pass2] wrote {written:,} rows', file=sys.stderr)
+        # flush the last partial batch
+        if batch:
+            writer.writerows(batch)
+    # final summary
+    print(f'[pass2] finished. total rows: {written:,}. output: {dst_path}', file=sys.stderr)
+
+# write the csv by streaming the file again
+def write_csv(src_path, dst_path, columns, flatten, explode_key=None, explode_all=False, progress_every=200000, extra_column=None):
+    # read ndjson again, write_records flattens each record into its row
+    with closing(iter_records(src_path, False)) as records:
+        write_records(records, dst_path, columns, flatten, explode_key=explode_key, explode_all=explode_all, progress_every=progress_every, extra_column=extra_column)
+
+# yield records back from a spill file written by convert_single_pass
+def iter_spilled_records(spill):
+    # records were pickled in batches, read until the end of the file
+    while True:
+        try:
+            batch = pickle.load(spill)
+        except EOFError:
+            return
+        yield from batch
+
+# convert while reading the input only once: spill records to a temp file while collecting columns
+def convert_single_pass(src_path, dst_path, flatten, explode_key=None, explode_all=False, sort_columns=False, progress_every=200000):
+    # keep the spill next to the output, it is about as large as the parsed input
+    spill_dir = os.path.dirname(os.path.abspath(dst_path)) or '.'
+    os.makedirs(spill_dir, exist_ok=True)
+    # keep column names in the order they first appear
+    keys = {}
+    # count scanned lines
+    count = 0
+    with tempfile.TemporaryFile(dir=spill_dir, buffering=1 << 20) as spill, closing(iter_records(src_path, flatten, explode_key=explode_key, explode_all=explode_all)) as records:
+        # records waiting to be pickled in one dump call
+        batch = []
+        for count, rec in enumerate(records, start=1):
+            add_keys(keys, rec)
+            batch.append(rec)
+            if len(batch) >= WRITE_BATCH_SIZE:
+                pickle.dump(batch, spill, pickle.HIGHEST_PROTOCOL)
+                batch.clear()
+            # show progress if needed
+            if progress_every and count % progress_every == 0:
+                print(f'[pass1] parsed {count:,} lines, found {len(keys):,} columns', file=sys.stderr)
+        # flush the last partial batch
+        if batch:
+            pickle.dump(batch, spill, pickle.HIGHEST_PROTOCOL)
+        # if no lines found, raise
+        if count == 0:
+            raise RuntimeError('no lines found. is this file empty or not ndjson?')
+        # keep input order unless alphabetical columns were asked for
+        cols = sorted(keys) if sort_columns else list(keys)
+        print(f'[pass1] done. lines: {count:,}, columns: {len(cols):,}', file=sys.stderr)
+        # write the csv from the spill instead of parsing the input again
+        spill.seek(0)
+        write_records(iter_spilled_records(spill), dst_path, cols, flatten, explode_key=explode_key, explode_all=explode_all, progress_every=progress_every, preflattened=True)
+
+# per-process settings for --workers mode, filled by init_worker
+WORKER_STATE = {}
+
+# split a plain file into byte ranges that end on line boundaries, enough to keep every worker busy
+def split_line_ranges(path, workers):
+    size = os.path.getsize(path)
+    # aim for a few ranges per worker so uneven ranges even out, capped in size
+    step = max(1, min(PARALLEL_CHUNK_SIZE, -(-size // (workers * 4))))
+    ranges = []
+    if size == 0:
+        return ranges
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        start = 0
+        while start < size:
+            # move the cut to just after the next newline
+            nl = buf.find(b'\n', start + step - 1)
+            end = size if nl < 0 else nl + 1
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+# store the settings each worker needs once, instead of sending them with every range
+def init_worker(src_path, columns, flatten, explode_key, explode_all):
+    WORKER_STATE.update(src_path=src_path, columns=columns, flatten=flatten, explode_key=explode_key, explode_all=explode_all)
+    # compile the row builder once per process, not once per range (slow on wide headers)
+    build_row = None
+    if columns is not None and not explode_key and not explode_all:
+        build_row = compile_row_builder(columns, flatten)
+    WORKER_STATE['build_row'] = build_row
+
+# yield the lines of one byte range of the input
+def iter_range_lines(byte_range):
+    with open(WORKER_STATE['src_path'], 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        yield from iter_mmap_lines(buf, *byte_range)
+
+# worker: collect the column names of one byte range, returns (keys, line count)
+def discover_range(byte_range):
+    st = WORKER_STATE
+    keys = {}
+    count = 0
+    keep_lists_for = [st['explode_key']] if st['explode_key'] else []
+    lazy_parser = simdjson.Parser() if simdjson is not None else None
+    try:
+        for count, line in enumerate(iter_range_lines(byte_range), start=1):
+            add_line_keys(line, count, keys, lazy_parser, st['flatten'], keep_lists_for, st['explode_all'])
+    except RuntimeError as e:
+        raise RuntimeError(f'{e} (counting from byte {byte_range[0]:,})') from e
+    return keys, count
+
+# worker: render one byte range as csv text (no header), returns (text, row count)
+def write_range(byte_range):
+    st = WORKER_STATE
+    out = io.StringIO()
+    writer = csv.writer(out)
+    records = parse_records(iter_range_lines(byte_range), False)
+    rows = list(iter_rows(records, st['columns'], st['flatten'], explode_key=st['explode_key'], explode_all=st['explode_all'], build_row=st['build_row']))
+    writer.writerows(rows)
+    return out.getvalue(), len(rows)
+
+# discover columns with a pool of worker processes, one byte range at a time
+def discover_columns_parallel(src_path, flatten, explode_key=None, explode_all=False, workers=2, sort_columns=False, progress_every=200000):
+    keys = {}
+    count = 0
+    ranges = split_line_ranges(src_path, workers)
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(src_path, None, flatten, explode_key, explode_all)) as pool:
+        # merge ranges in input order so columns come out in the same order as one process
+        for range_keys, range_count in pool.imap(discover_range, ranges):
+            keys.update(range_keys)
+            # show progress if needed
+            if progress_every and (count + range_count) // progress_every > count // progress_every:
+                print(f'[pass1] scanned {count + range_count:,} lines, found {len(keys):,} columns', file=sys.stderr)
+            count += range_count
+    # if no lines found, raise
+    if count == 0:
+        raise RuntimeError('no lines found. is this file empty or not ndjson?')
+    # keep input order unless alphabetical columns were asked for
+    cols = sorted(keys) if sort_columns else list(keys)
+    print(f'[pass1] done. lines: {count:,}, columns: {len(cols):,}', file=sys.stderr)
+    return cols
+
+# write the csv with a pool of worker processes, blocks are written back in input order
+def write_csv_parallel(src_path, dst_path, columns, flatten, explode_key=None, explode_all=False, workers=2, progress_every=200000):
+    # make sure the output folder exists
+    os.makedirs(os.path.dirname(os.path.abspath(dst_path)) or '.', exist_ok=True)
+    written = 0
+    ranges = split_line_ranges(src_path, workers)
+    with open_text_write(dst_path) as out_f:
+        # write header
+        csv.writer(out_f).writerow(columns)
+        with multiprocessing.Pool(workers, initializer=init_worker, initargs=(src_path, columns, flatten, explode_key, explode_all)) as pool:
+            for text, rows in pool.imap(write_range, ranges):
+                out_f.write(text)
+                # show progress if needed
+                if progress_every and (written + rows) // progress_every > written // progress_every:
+                    print(f'[pass2] wrote {written + rows:,} rows', file=sys.stderr)
+                written += rows
     # final summary
     print(f'[pass2] finished. total rows: {written:,}. output: {dst_path}', file=sys.stderr)
 
+# the same arrow type with timestamps read back as strings (arrow infers them from date-like text)
+def arrow_text_type(t):
+    if pyarrow.types.is_timestamp(t):
+        return pyarrow.string()
+    if pyarrow.types.is_struct(t):
+        return pyarrow.struct([t.field(i).with_type(arrow_text_type(t.field(i).type)) for i in range(t.num_fields)])
+    if pyarrow.types.is_list(t):
+        return pyarrow.list_(t.value_field.with_type(arrow_text_type(t.value_type)))
+    return t
+
+# drop the null members arrow fills into structs for keys a record did not have
+def arrow_drop_nulls(v):
+    if type(v) is dict:
+        return {k: arrow_drop_nulls(x) for k, x in v.items() if x is not None}
+    if type(v) is list:
+        return [arrow_drop_nulls(x) for x in v]
+    return v
+
+# json text for every value of an arrow column the csv writer cannot take (lists, structs)
+def arrow_json_column(col):
+    return pyarrow.array([None if v is None else dumps_json(arrow_drop_nulls(v)) for v in col.to_pylist()], pyarrow.string())
+
+# true when a float column holds an integer of 64 bits or more, which arrow reads as a rounded double
+def arrow_has_wide_int(col):
+    if pyarrow.types.is_floating(col.type):
+        wide = pyarrow.compute.greater_equal(pyarrow.compute.abs(col), ARROW_WIDE_INT)
+        return pyarrow.compute.any(pyarrow.compute.and_(wide, pyarrow.compute.equal(pyarrow.compute.floor(col), col))).as_py() is True
+    if pyarrow.types.is_struct(col.type):
+        return any(arrow_has_wide_int(pyarrow.compute.struct_field(col, [i])) for i in range(col.type.num_fields))
+    if pyarrow.types.is_list(col.type):
+        return arrow_has_wide_int(pyarrow.compute.list_flatten(col))
+    return False
+
+# flatten one column into dotted names, a struct that is null itself (not through its parent) also keeps its own empty column like the python engine
+def arrow_flatten_column(name, col, parent_null, names, cols):
+    if not pyarrow.types.is_struct(col.type):
+        names.append(name)
+        cols.append(col)
+        return
+    null = pyarrow.compute.is_null(col)
+    own_null = null if parent_null is None else pyarrow.compute.and_not(null, parent_null)
+    first_null = pyarrow.compute.index(own_null, True).as_py()
+    first_valid = pyarrow.compute.index(null, False).as_py()
+    # the parent column goes before or after its fields by which shows up first
+    before = first_null != -1 and (first_valid == -1 or first_null < first_valid)
+    if before:
+        names.append(name)
+        cols.append(pyarrow.nulls(len(col), pyarrow.string()))
+    for i in range(col.type.num_fields):
+        arrow_flatten_column(f'{name}.{col.type.field(i).name}', pyarrow.compute.struct_field(col, [i]), null, names, cols)
+    if first_null != -1 and not before:
+        names.append(name)
+        cols.append(pyarrow.nulls(len(col), pyarrow.string()))
+
+# flatten, explode and serialize one arrow table column-wise so it can go to the csv writer
+def arrow_prepare(table, flatten, explode_key=None, sort_columns=False):
+    # flatten struct columns into dotted names
+    if flatten:
+        names, cols = [], []
+        for name, col in zip(table.column_names, table.columns):
+            arrow_flatten_column(name, col, None, names, cols)
+        table = pyarrow.table(cols, names=names)
+    # explode one list column, rows with an empty or null list keep one empty cell
+    if explode_key in table.column_names and pyarrow.types.is_list(table.schema.field(explode_key).type):
+        col = table[explode_key]
+        names = table.column_names
+        lengths = pyarrow.compute.fill_null(pyarrow.compute.list_value_length(col), 0)
+        col = pyarrow.compute.if_else(pyarrow.compute.equal(lengths, 0), pyarrow.scalar([None], col.type), col)
+        table = table.drop_columns([explode_key]).take(pyarrow.compute.list_parent_indices(col))
+        # put the exploded column back where it was
+        table = table.append_column(explode_key, pyarrow.compute.list_flatten(col)).select(names)
+    # lists and structs that are left become json text, booleans are written like python does
+    for i, field in enumerate(table.schema):
+        if pyarrow.types.is_nested(field.type):
+            table = table.set_column(i, field.name, arrow_json_column(table.column(i)))
+        elif pyarrow.types.is_boolean(field.type):
+            table = table.set_column(i, field.name, pyarrow.compute.if_else(table.column(i), 'True', 'False'))
+    # keep input order unless alphabetical columns were asked for, like the python engine
+    return table.select(sorted(table.column_names)) if sort_columns else table
+
+# convert with pyarrow: parse, flatten, explode and write csv one record batch at a time
+def convert_arrow(src_path, dst_path, flatten, explode_key=None, sort_columns=False, progress_every=200000):
+    # make sure the output folder exists
+    os.makedirs(os.path.dirname(os.path.abspath(dst_path)) or '.', exist_ok=True)
+    # write .gz output through arrow's own gzip stream
+    if dst_path.lower().endswith('.gz'):
+        sink = pyarrow.CompressedOutputStream(dst_path, 'gzip')
+    else:
+        sink = pyarrow.OSFile(dst_path, 'wb')
+    writer = None
+    written = 0
+    with sink:
+        try:
+            # arrow reads .gz input by extension and infers the schema from the first block
+            read_options = pyarrow.json.ReadOptions(block_size=ARROW_BLOCK_SIZE)
+            reader = pyarrow.json.open_json(src_path, read_options=read_options)
+            # reopen with timestamps as strings, so date-like text is written as it was
+            schema = pyarrow.schema([field.with_type(arrow_text_type(field.type)) for field in reader.schema])
+            if not schema.equals(reader.schema):
+                reader.close()
+                reader = pyarrow.json.open_json(src_path, read_options=read_options, parse_options=pyarrow.json.ParseOptions(explicit_schema=schema))
+            for batch in reader:
+                # arrow has no wider integer type, stop instead of writing rounded numbers
+                wide = next((name for name, col in zip(batch.schema.names, batch.columns) if arrow_has_wide_int(col)), None)
+                if wide is not None:
+                    raise RuntimeError(f'arrow read a number of 2**63 or more in column {wide} as a float and would round it, try the default python engine')
+                table = arrow_prepare(pyarrow.Table.from_batches([batch]), flatten, explode_key=explode_key, sort_columns=sort_columns)
+                # the header comes from the first batch, later batches must match it
+                if writer is None:
+                    header = table.schema
+                    writer = pyarrow.csv.CSVWriter(sink, header, write_options=pyarrow.csv.WriteOptions(eol='\r\n'))
+                elif table.column_names != header.names:
+                    # null structs can add or drop (always empty) parent columns from batch to batch
+                    table = pyarrow.table([table[field.name] if field.name in table.column_names else pyarrow.nulls(table.num_rows, field.type) for field in header], schema=header)
+                writer.write_table(table)
+                # show progress if needed
+                if progress_every and (written + table.num_rows) // progress_every > written // progress_every:
+                    print(f'[arrow] wrote {written + table.num_rows:,} rows', file=sys.stderr)
+                written += table.num_rows
+        except pyarrow.ArrowInvalid as e:
+            raise RuntimeError(f'arrow could not convert this input ({e}), try the default python engine') from e
+        if writer is None:
+            raise RuntimeError('no lines found. is this file empty or not ndjson?')
+        writer.close()
+    # final summary
+    print(f'[arrow] finished. total rows: {written:,}. output: {dst_path}', file=sys.stderr)
+
 # main function for command line
 def main():
     # set up arguments
@@ -223,6 +947,16 @@ def main():
     parser.add_argument('--explode-all', action='store_true', help='explode all list columns (cartesian product)')
     # discovery limit
     parser.add_argument('--discover-limit', type=int, default=None, help='scan only first N lines to build header')
+    # full discovery
+    parser.add_argument('--strict-discovery', action='store_true', help=f'scan every line for columns instead of stopping after {DISCOVERY_STABLE_LINES:,} lines without a new one')
+    # single pass
+    parser.add_argument('--single-pass', action='store_true', help='read and parse the input once, spilling records to a temp file next to the output')
+    # conversion engine
+    parser.add_argument('--engine', choices=('python', 'arrow'), default='python', help='arrow converts column-wise with pyarrow (one schema, arrow csv quoting)')
+    # column order
+    parser.add_argument('--sort-columns', action='store_true', help='sort columns alphabetically instead of keeping input order')
+    # worker processes
+    parser.add_argument('--workers', type=int, default=1, help='convert plain (non-.gz) input with N processes')
     # progress interval
     parser.add_argument('--progress-every', type=int, default=200000, help='print progress every N rows (0 to disable)')
     # parse args
@@ -233,18 +967,93 @@ def main():
         print('choose either --explode-column or --explode-all, not both', file=sys.stderr)
         sys.exit(1)
 
+    # single pass sees every line, so a discovery limit does not apply
+    if args.single_pass and args.discover_limit:
+        print('choose either --single-pass or --discover-limit, not both', file=sys.stderr)
+        sys.exit(1)
+
+    # workers split the input file by byte ranges, which needs a plain file and a full scan
+    if args.workers > 1 and (args.single_pass or args.discover_limit):
+        print('--workers cannot be combined with --single-pass or --discover-limit', file=sys.stderr)
+        sys.exit(1)
+    if args.workers > 1 and args.input.lower().endswith('.gz'):
+        print('--workers needs plain (non-.gz) input, converting with one process', file=sys.stderr)
+        args.workers = 1
+
+    # the arrow engine reads the input once and infers its own schema
+    if args.engine == 'arrow':
+        if pyarrow is None:
+            print('--engine arrow needs pyarrow (pip install pyarrow)', file=sys.stderr)
+            sys.exit(1)
+        if args.explode_all or args.single_pass or args.discover_limit or args.workers > 1:
+            print('--engine arrow cannot be combined with --explode-all, --single-pass, --discover-limit or --workers', file=sys.stderr)
+            sys.exit(1)
+
     # check file exists
     if not os.path.exists(args.input):
         print(f'input not found: {args.input}', file=sys.stderr)
         sys.exit(1)
 
+    # convert in one read of the input
+    if args.single_pass:
+        convert_single_pass(
+            src_path=args.input,
+            dst_path=args.output,
+            flatten=args.flatten,
+            explode_key=args.explode_column,
+            explode_all=args.explode_all,
+            sort_columns=args.sort_columns,
+            progress_every=args.progress_every
+        )
+        return
+
+    # convert column-wise with pyarrow
+    if args.engine == 'arrow':
+        convert_arrow(
+            src_path=args.input,
+            dst_path=args.output,
+            flatten=args.flatten,
+            explode_key=args.explode_column,
+            sort_columns=args.sort_columns,
+            progress_every=args.progress_every
+        )
+        return
+
+    # convert with a pool of processes over byte ranges of the input
+    if args.workers > 1:
+        columns = discover_columns_parallel(
+            src_path=args.input,
+            flatten=args.flatten,
+            explode_key=args.explode_column,
+            explode_all=args.explode_all,
+            workers=args.workers,
+            sort_columns=args.sort_columns,
+            progress_every=args.progress_every
+        )
+        write_csv_parallel(
+            src_path=args.input,
+            dst_path=args.output,
+            columns=columns,
+            flatten=args.flatten,
+            explode_key=args.explode_column,
+            explode_all=args.explode_all,
+            workers=args.workers,
+            progress_every=args.progress_every
+        )
+        return
+
+    # stop discovery once columns settle, unless a full scan or a fixed limit was asked for
+    stable_lines = None if args.strict_discovery or args.discover_limit else DISCOVERY_STABLE_LINES
+
     # discover columns
-    columns = discover_columns(
+    columns, extra_column = discover_columns(
         src_path=args.input,
         flatten=args.flatten,
         explode_key=args.explode_column,
         explode_all=args.explode_all,
         limit=args.discover_limit,
+        stable_lines=stable_lines,
+        sort_columns=args.sort_columns,
         progress_every=args.progress_every
     )
 
@@ -256,7 +1065,8 @@ def main():
         flatten=args.flatten,
         explode_key=args.explode_column,
         explode_all=args.explode_all,
-        progress_every=args.progress_every
+        progress_every=args.progress_every,
+        extra_column=extra_column
     )
 
 if __name__ == '__main__':
@@ -0,0 +1,74 @@
+# cython: language_level=3
+# compiled versions of the per-record hot path in convertJsonToCSV.py
+# build next to the script with: python setup.py build_ext --inplace
+import json
+from functools import lru_cache
+
+# list element types whose json text can be cached by value (bool/float excluded, True == 1 == 1.0)
+cdef frozenset STR_LIST_TYPES = frozenset((str,))
+cdef frozenset INT_LIST_TYPES = frozenset((int,))
+
+# longest list whose json text is cached
+cdef Py_ssize_t CACHEABLE_LIST_LEN = 32
+
+# most characters in the strings of a cached list, so unique long lists do not pile up in the cache
+cdef Py_ssize_t CACHEABLE_LIST_CHARS = 256
+
+# json text for a tuple of strings/ints, the same tag lists tend to repeat across records
+@lru_cache(maxsize=4096)
+def dumps_cached(key):
+    return json.dumps(key, ensure_ascii=False)
+
+# serialize a list or dict to json text, short lists of strings or of ints come from the cache
+cpdef str dumps_json(val):
+    cdef set types
+    if type(val) is list and len(<list>val) <= CACHEABLE_LIST_LEN:
+        types = set(map(type, val))
+        if types <= INT_LIST_TYPES or types == STR_LIST_TYPES and sum(map(len, val)) <= CACHEABLE_LIST_CHARS:
+            return dumps_cached(tuple(val))
+    return json.dumps(val, ensure_ascii=False)
+
+# flatten obj into out, prefix already ends with the separator (or is empty at the root)
+cdef int _flatten_into(dict obj, str prefix, str sep, dict out, set keep_lists_for, bint explode_all) except -1:
+    cdef str new_key
+    for k, v in obj.items():
+        # build the dotted key
+        new_key = prefix + k
+        # if value is dict, flatten it under this key
+        if isinstance(v, dict):
+            _flatten_into(<dict>v, new_key + sep if new_key else '', sep, out, keep_lists_for, explode_all)
+        # keep lists for explode, otherwise keep as json string so csv stays rectangular
+        elif isinstance(v, list):
+            if explode_all or new_key in keep_lists_for:
+                out[new_key] = v
+            else:
+                out[new_key] = dumps_json(v)
+        # otherwise keep the value
+        else:
+            out[new_key] = v
+    return 0
+
+# flatten a nested dict into out (e.g. a prefilled row) using dotted keys
+def flatten_into(obj, dict out, parent_key='', sep='.', keep_lists_for=None, explode_all=False):
+    # if the root is not a dict, store it as a single value
+    if not isinstance(obj, dict):
+        out[parent_key or 'value'] = obj
+        return out
+    # define which keys should stay as lists
+    if type(keep_lists_for) is not set:
+        keep_lists_for = set(keep_lists_for or [])
+    _flatten_into(<dict>obj, parent_key + sep if parent_key else '', sep, out, <set>keep_lists_for, explode_all)
+    return out
+
+# flatten a nested dict into one level using dotted keys
+def flatten_dict(obj, parent_key='', sep='.', keep_lists_for=None, explode_all=False):
+    return flatten_into(obj, {}, parent_key, sep=sep, keep_lists_for=keep_lists_for, explode_all=explode_all)
+
+# turn one expanded row dict (already holding every column) into a csv row tuple
+def process_record(dict row, get_row, bint convert_cells):
+    # serialize nested values in place (None is written as empty by csv already)
+    if convert_cells:
+        for k, v in row.items():
+            if type(v) is list or type(v) is dict:
+                row[k] = dumps_json(v)
+    return get_row(row)
@@ -0,0 +1,9 @@
+# builds the optional compiled hot path (convert_core) next to convertJsonToCSV.py
+# usage: pip install cython && python setup.py build_ext --inplace
+from Cython.Build import cythonize
+from setuptools import setup
+
+setup(
+    name='convert_core',
+    ext_modules=cythonize('convert_core.pyx', language_level=3),
+)
@@ -1,9 +1,17 @@
 import csv
+import gzip
+import json
 import os
 import subprocess
+import tempfile
 import unittest
 from pathlib import Path
 
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
 REPO = Path(__file__).resolve().parents[1]
 SCRIPT = REPO / 'convertJsonToCSV.py'
 SAMPLE = REPO / 'sample_data' / 'sample.ndjson'
@@ -13,11 +21,13 @@ OUT_PLAIN = REPO / 'sample_data' / 'out_plain.csv'
 OUT_FLAT = REPO / 'sample_data' / 'out_flat.csv'
 OUT_EXPLODED = REPO / 'sample_data' / 'out_exploded.csv'
 OUT_EXPLODED_ALL = REPO / 'sample_data' / 'out_exploded_all.csv'
+OUT_SINGLE_PASS = REPO / 'sample_data' / 'out_single_pass.csv'
+OUT_WORKERS = REPO / 'sample_data' / 'out_workers.csv'
 
 class TestConvertJsonToCSV(unittest.TestCase):
 
     def setUp(self):
-        for p in (OUT_PLAIN, OUT_FLAT, OUT_EXPLODED, OUT_EXPLODED_ALL):
+        for p in (OUT_PLAIN, OUT_FLAT, OUT_EXPLODED, OUT_EXPLODED_ALL, OUT_SINGLE_PASS, OUT_WORKERS):
             if p.exists():
                 p.unlink()
 
@@ -30,7 +40,7 @@ class TestConvertJsonToCSV(unittest.TestCase):
         self.assertTrue(OUT_PLAIN.exists(), 'plain CSV not created')
         with OUT_PLAIN.open(newline='', encoding='utf-8') as f:
             r = list(csv.reader(f))
-        self.assertEqual(r[0], ['song', 'tags', 'year'], 'plain header mismatch')
+        self.assertEqual(r[0], ['song', 'year', 'tags'], 'plain header mismatch')
         self.assertGreaterEqual(len(r), 3, 'plain CSV missing rows')
 
     def test_flatten(self):
@@ -54,7 +64,8 @@ class TestConvertJsonToCSV(unittest.TestCase):
             '-i', str(SAMPLE),
             '-o', str(OUT_EXPLODED),
             '--flatten',
-            '--explode-column', 'tags'
+            '--explode-column', 'tags',
+            '--sort-columns'
         ])
         self.assertTrue(OUT_EXPLODED.exists(), 'exploded CSV not created')
         with OUT_EXPLODED.open(newline='', encoding='utf-8') as f:
@@ -95,5 +106,177 @@ class TestConvertJsonToCSV(unittest.TestCase):
         projected = set(tuple(row[i] for i in proj_idx) for row in r[1:])
         self.assertTrue(expected_subset.issubset(projected))
 
+    def test_single_pass_matches_two_pass(self):
+        subprocess.check_call([
+            'python3', str(SCRIPT),
+            '-i', str(SAMPLE),
+            '-o', str(OUT_EXPLODED),
+            '--flatten',
+            '--explode-column', 'tags'
+        ])
+        subprocess.check_call([
+            'python3', str(SCRIPT),
+            '-i', str(SAMPLE),
+            '-o', str(OUT_SINGLE_PASS),
+            '--flatten',
+            '--explode-column', 'tags',
+            '--single-pass'
+        ])
+        self.assertTrue(OUT_SINGLE_PASS.exists(), 'single-pass CSV not created')
+        self.assertEqual(OUT_SINGLE_PASS.read_bytes(), OUT_EXPLODED.read_bytes())
+
+    def test_workers_match_single_process(self):
+        subprocess.check_call([
+            'python3', str(SCRIPT),
+            '-i', str(SAMPLE_MULTI),
+            '-o', str(OUT_EXPLODED_ALL),
+            '--flatten',
+            '--explode-all'
+        ])
+        subprocess.check_call([
+            'python3', str(SCRIPT),
+            '-i', str(SAMPLE_MULTI),
+            '-o', str(OUT_WORKERS),
+            '--flatten',
+            '--explode-all',
+            '--workers', '2'
+        ])
+        self.assertTrue(OUT_WORKERS.exists(), 'workers CSV not created')
+        self.assertEqual(OUT_WORKERS.read_bytes(), OUT_EXPLODED_ALL.read_bytes())
+
+    def test_late_columns_go_to_extra(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = Path(tmp) / 'late.ndjson'
+            out = Path(tmp) / 'late.csv'
+            out_exploded = Path(tmp) / 'late_exploded.csv'
+            with src.open('w', encoding='utf-8') as f:
+                for i in range(50001):
+                    f.write(json.dumps({'id': i, 'song': {'track': 'T'}, 'tags': [1]}) + '\n')
+                f.write(json.dumps({'id': 'late', 'song': {'track': 'T', 'bpm': 120}, 'tags': [1, 2, 3], 'meta': {'k': [1, 2]}}) + '\n')
+            subprocess.check_call([
+                'python3', str(SCRIPT),
+                '-i', str(src),
+                '-o', str(out),
+                '--flatten',
+                '--progress-every', '0'
+            ])
+            subprocess.check_call([
+                'python3', str(SCRIPT),
+                '-i', str(src),
+                '-o', str(out_exploded),
+                '--explode-column', 'tags',
+                '--progress-every', '0'
+            ])
+            with out.open(newline='', encoding='utf-8') as f:
+                r = list(csv.reader(f))
+            with out_exploded.open(newline='', encoding='utf-8') as f:
+                r_exploded = list(csv.reader(f))
+        self.assertEqual(r[0], ['id', 'song.track', 'tags', '_extra'])
+        self.assertEqual(r[-1], ['late', 'T', '[1, 2, 3]', '{"song.bpm": 120, "meta.k": "[1, 2]"}'])
+        self.assertEqual(r[1], ['0', 'T', '[1]', ''])
+        # every exploded row carries the same extra cell
+        self.assertEqual(r_exploded[0], ['id', 'song', 'tags', '_extra'])
+        self.assertEqual(r_exploded[-3:], [
+            ['late', '{"track": "T", "bpm": 120}', str(n), '{"meta": {"k": [1, 2]}}'] for n in (1, 2, 3)
+        ])
+
+    def test_extra_column_keeps_input_extra(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = Path(tmp) / 'late.ndjson'
+            out = Path(tmp) / 'late.csv'
+            with src.open('w', encoding='utf-8') as f:
+                for i in range(50001):
+                    f.write(json.dumps({'id': i, '_extra': 'mine'}) + '\n')
+                f.write(json.dumps({'id': 'late', '_extra': 'mine', 'new': 1}) + '\n')
+            subprocess.check_call([
+                'python3', str(SCRIPT),
+                '-i', str(src),
+                '-o', str(out),
+                '--progress-every', '0'
+            ])
+            with out.open(newline='', encoding='utf-8') as f:
+                r = list(csv.reader(f))
+        self.assertEqual(r[0], ['id', '_extra', '__extra'])
+        self.assertEqual(r[-1], ['late', 'mine', '{"new": 1}'])
+
+    def test_wide_integers_stay_exact(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = Path(tmp) / 'wide.ndjson'
+            out = Path(tmp) / 'wide.csv'
+            # a 19-digit negative below int64 has its own line, so no longer run sends the line to json
+            src.write_text(
+                '{"id": 123456789012345678901234567890, "n": -98765432109876543210}\n'
+                '{"id": 1, "n": -9223372036854775809}\n',
+                encoding='utf-8'
+            )
+            subprocess.check_call([
+                'python3', str(SCRIPT),
+                '-i', str(src),
+                '-o', str(out)
+            ])
+            with out.open(newline='', encoding='utf-8') as f:
+                r = list(csv.reader(f))
+        self.assertEqual(r[1:], [['123456789012345678901234567890', '-98765432109876543210'], ['1', '-9223372036854775809']])
+
+    @unittest.skipUnless(pyarrow, 'pyarrow not installed')
+    def test_arrow_engine_matches_python_cells(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            src = Path(tmp) / 'arrow.ndjson'
+            with src.open('w', encoding='utf-8') as f:
+                f.write(json.dumps({'song': {'artist': 'A', 'track': 'X'}, 'day': '2020-01-02', 'hit': True, 'year': 2011, 'tags': ['a', 'b']}) + '\n')
+                f.write(json.dumps({'song': {'artist': 'B'}, 'day': '2021-05-06', 'hit': False, 'year': 2000, 'tags': []}) + '\n')
+                f.write(json.dumps({'song': None, 'day': '2022-07-08', 'hit': True, 'year': 1999, 'tags': ['c']}) + '\n')
+            # a null struct adds its own column when flattened, sorted so both engines put it in the same place
+            for args in ([], ['--flatten', '--sort-columns'], ['--flatten', '--sort-columns', '--explode-column', 'tags']):
+                outputs = []
+                for engine in ('python', 'arrow'):
+                    out = Path(tmp) / f'{engine}.csv'
+                    subprocess.check_call([
+                        'python3', str(SCRIPT),
+                        '-i', str(src),
+                        '-o', str(out),
+                        '--engine', engine
+                    ] + args)
+                    with out.open(newline='', encoding='utf-8') as f:
+                        outputs.append(list(csv.reader(f)))
+                # arrow quotes differently, the cells themselves must match
+                self.assertEqual(outputs[1], outputs[0], args)
+            # integers past 64 bits would be rounded by arrow, it must refuse instead
+            wide = Path(tmp) / 'wide.ndjson'
+            wide.write_text('{"id": 1}\n{"id": 123456789012345678901234567890}\n', encoding='utf-8')
+            result = subprocess.run([
+                'python3', str(SCRIPT),
+                '-i', str(wide),
+                '-o', str(Path(tmp) / 'wide.csv'),
+                '--engine', 'arrow'
+            ], capture_output=True, text=True)
+            self.assertNotEqual(result.returncode, 0)
+            self.assertIn('python engine', result.stderr)
+
+    def test_gzip_input_matches_plain(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            # a line longer than the 1 MiB gzip read block, and a last line without a newline
+            text = ''.join(json.dumps({'id': i, 'tags': ['a', str(i)]}) + '\n' for i in range(1000))
+            text += json.dumps({'id': 'long', 'blob': 'x' * (3 << 20)}) + '\n'
+            text += ''.join(json.dumps({'id': i, 'song': {'track': 'T'}}) + '\n' for i in range(1000))
+            text += json.dumps({'id': 'last'})
+            src = Path(tmp) / 'in.ndjson'
+            src_gz = Path(tmp) / 'in.ndjson.gz'
+            src.write_text(text, encoding='utf-8')
+            with gzip.open(src_gz, 'wt', encoding='utf-8') as f:
+                f.write(text)
+            outputs = []
+            for path in (src, src_gz):
+                out = Path(tmp) / (path.name + '.csv')
+                subprocess.check_call([
+                    'python3', str(SCRIPT),
+                    '-i', str(path),
+                    '-o', str(out),
+                    '--flatten'
+                ])
+                outputs.append(out.read_bytes())
+        self.assertEqual(outputs[1], outputs[0])
+        self.assertTrue(outputs[0].endswith(b'last,,,\r\n'))
+
 if __name__ == '__main__':
     unittest.main()